@@ -134,7 +134,10 @@ def analyze_spi_flash(verbose=False):
     # 0x300000 spiffs bytes at 0xD00000
     _size = 0x300000
     be_verbose('ktool_sector', 'SPI Flash File System', hex(cursor), hex(cursor+_size))
-    be_verbose('listdir("/flash"): {}'.format(listdir('/flash')))
+    try:
+        be_verbose('listdir("/flash"): {}'.format(listdir('/flash')))
+    except OSError:
+        be_verbose('listdir("/flash"): not mounted here')
     _hash = hash_flash(cursor, _size, verbose=decremented_bool(verbose))
     if len(_hash) == 32:
         valid, bytes_read = True, _size
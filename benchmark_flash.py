@@ -0,0 +1,448 @@
+'''
+regression benchmarks for the tools in this repo, run against SimulatedFlash
+
+Each benchmark times a tool and counts its flash_read() calls and bytes, then compares
+bytes read against the bytes the tool actually needs (amplification).  Budgets are
+the read counts and amplification measured when the benchmark was written;
+exceeding one means a tool started re-reading flash.
+
+benchmark_heap() does the same for heap usage, profiling tools with profile_flash():
+budgets are the heap peak above start and the heap blocks allocated during the call,
+which every flash_read() buffer adds to.  The check_*() functions assert that the
+other tools still give correct answers against a SimulatedFlash.
+
+ie: `python benchmark_flash.py` from this directory, adding `--check-overlap` to also fail
+when pipelined hashing does not beat serial hashing, or, with every tool pasted:
+`benchmark_flash(SimulatedFlash(firmwares={0x80000: 1500000, 0x280000: 1400000}))`
+'''
+
+
+def benchmark_flash(flash=None, check=True, verbose=True):
+    '''
+    returns a list of tuple(name, seconds, reads, bytes read, amplification, simulated seconds)
+
+    when check is True, raises AssertionError for any benchmark over its budget.
+    '''
+
+    import sys
+    from time import perf_counter
+
+    global utils
+
+    class Quiet:
+        def write(self, text):
+            pass
+
+    def cached(func, capacity=32, readahead=8):
+        global utils
+        utils = CachedFlashUtils(flash, capacity, readahead)
+        try:
+            return func()
+        finally:
+            utils = flash
+
+    if flash is None:
+        flash = SimulatedFlash(firmwares={0x80000: 1500000, 0x280000: 1400000})
+    slot1_size = flash.apps[0x80000]
+
+    benchmarks = [
+        # name, callable, bytes needed, budget: (max reads, max amplification)
+        ('analyze_spi_flash', lambda: analyze_spi_flash(),
+            2**24, (8256, 2.2)),
+        ('analyze_spi_flash cached', lambda: cached(analyze_spi_flash),
+            2**24, (1071, 2.2)),
+        ('analyze_spi_flash cached 8', lambda: cached(analyze_spi_flash, 8, 4),
+            2**24, (2096, 2.2)),
+        ('hash_flash slot1', lambda: hash_flash(0x80000+5, slot1_size),
+            slot1_size, (367, 1.0)),
+        ('hash_flash slot1 cached', lambda: cached(lambda: hash_flash(0x80000+5, slot1_size)),
+            slot1_size, (46, 1.01)),
+        ('crc32_flash slot1', lambda: crc32_flash(0x80000+5, slot1_size),
+            slot1_size, (367, 1.0)),
+        ('hashcrc_flash slot1', lambda: hashcrc_flash(0x80000+5, slot1_size, 2**16),
+            slot1_size, (23, 1.0)),
+        ('pipelined_hashcrc slot1', lambda: pipelined_hashcrc_flash(0x80000+5, slot1_size, 2**16),
+            slot1_size, (23, 1.0)),
+        ('all_bytes_are unused', lambda: all_bytes_are(b'\xff', 0x10000, 0x70000),
+            0x70000, (112, 1.0)),
+        ('all_bytes_are cached', lambda: cached(lambda: all_bytes_are(b'\xff', 0x10000, 0x70000)),
+            0x70000, (14, 1.0)),
+        ('validate slot1', lambda: validate_aes_size_app_sha_nulpad(0x80000),
+            slot1_size, (27, 1.01)),
+        ('validate slot1 cached', lambda: cached(lambda: validate_aes_size_app_sha_nulpad(0x80000)),
+            slot1_size, (25, 1.03)),
+        ('validate slot1 cached 8', lambda: cached(lambda: validate_aes_size_app_sha_nulpad(0x80000), 8, 4),
+            slot1_size, (25, 1.03)),
+        ('validate slot1 repeated', lambda: cached(lambda: [validate_aes_size_app_sha_nulpad(0x80000)
+            for i in range(2)]), slot1_size, (48, 2.01)),
+        ('KbootAppSector slot1', lambda: KbootAppSector(0x80000),
+            slot1_size, (23, 1.01)),
+        ('HexDumpSPIFlash page', lambda: HexDumpSPIFlash(0x80000, lines=64).read(),
+            16*64, (1, 1.0)),
+    ]
+
+    backend = utils
+    utils = flash
+    results = []
+    try:
+        for name, func, needed, budget in benchmarks:
+            flash.reset_counters()
+            stdout, sys.stdout = sys.stdout, Quiet()
+            began = perf_counter()
+            try:
+                func()
+            finally:
+                elapsed = perf_counter() - began
+                sys.stdout = stdout
+            results.append((
+                name, elapsed, flash.reads, flash.bytes_read,
+                flash.bytes_read / needed, flash.simulated_us / 1000000
+            ))
+            if verbose:
+                print('%-26s %8.3fs  reads: %6d  bytes: %9d  amplification: %5.2f  simulated: %7.3fs' % (
+                    results[-1]))
+            if check:
+                assert flash.reads <= budget[0], '%s: %d reads > budget of %d' % (
+                    name, flash.reads, budget[0])
+                assert flash.bytes_read <= needed * budget[1], '%s: amplification %.2f > budget of %.2f' % (
+                    name, flash.bytes_read / needed, budget[1])
+    finally:
+        utils = backend
+
+    return results
+
+
+def benchmark_heap(flash=None, check=True, verbose=True):
+    '''
+    returns a list of FlashProfile, one per benchmark, profiled on a computer
+
+    when check is True, raises AssertionError for any benchmark over its budget.
+    '''
+
+    import sys
+
+    global utils
+
+    class Quiet:
+        def write(self, text):
+            pass
+
+    if flash is None:
+        flash = SimulatedFlash(firmwares={0x80000: 1500000, 0x280000: 1400000})
+    slot1_size = flash.apps[0x80000]
+
+    benchmarks = [
+        # name, callable, budget: (max heap peak above start, max allocations)
+        ('hash_flash slot1', lambda: hash_flash(0x80000+5, slot1_size),
+            (12000, 400)),
+        ('all_bytes_are unused', lambda: all_bytes_are(b'\xff', 0x10000, 0x70000),
+            (12000, 130)),
+        ('validate slot1', lambda: validate_aes_size_app_sha_nulpad(0x80000),
+            (150000, 50)),
+        ('KbootAppSector slot1', lambda: KbootAppSector(0x80000),
+            (220000, 50)),
+        ('HexDumpSPIFlash page', lambda: HexDumpSPIFlash(0x80000, lines=64).read(),
+            (22000, 30)),
+    ]
+
+    backend = utils
+    utils = flash
+    profiles = []
+    try:
+        for name, func, budget in benchmarks:
+            stdout, sys.stdout = sys.stdout, Quiet()
+            try:
+                profile = profile_flash(func)[1]
+            finally:
+                sys.stdout = stdout
+            profile.name = name
+            profiles.append(profile)
+            if verbose:
+                print(profile)
+            if check:
+                assert profile.heap_peak - profile.heap_start <= budget[0], '%s: heap peak +%d > budget of %d' % (
+                    name, profile.heap_peak - profile.heap_start, budget[0])
+                assert profile.allocations <= budget[1], '%s: %d allocations > budget of %d' % (
+                    name, profile.allocations, budget[1])
+    finally:
+        utils = backend
+
+    return profiles
+
+
+def benchmark_pipelined(flash=None, check_overlap=False, verbose=True):
+    '''
+    asserts that the pipelined hashing tools return the same results as the serial ones
+    for several block sizes and depths, then times both against a SimulatedFlash in
+    realtime, whose bandwidth is set so that reading takes as long as hashing.
+
+    returns tuple(best serial seconds, best pipelined seconds).  Timing is only printed,
+    since wall-clock ratios depend on machine load; when check_overlap is True,
+    raises AssertionError unless pipelining took less than 0.85 of the serial time.
+    '''
+
+    from time import perf_counter
+
+    global utils
+
+    if flash is None:
+        flash = SimulatedFlash(firmwares={0x80000: 1500000, 0x280000: 1400000})
+
+    backend = utils
+    utils = flash
+    try:
+        begin, length = 0x80000 + 5, flash.apps[0x80000] + 32
+        for block_size in (0x1000, 5000, 0x10000):
+            for depth in (2, 4, 8):
+                assert pipelined_hash_flash(begin, length, block_size, depth) == hash_flash(
+                    begin, length, block_size), ('hash_flash', block_size, depth)
+                assert pipelined_crc32_flash(begin, length, block_size, depth) == crc32_flash(
+                    begin, length, block_size), ('crc32_flash', block_size, depth)
+                assert pipelined_hashcrc_flash(begin, length, block_size, depth) == hashcrc_flash(
+                    begin, length, block_size), ('hashcrc_flash', block_size, depth)
+        # a length past the end of flash, as when hashing a truncated flash_dump
+        begin, length = flash.size - 25600, 30000
+        for depth in (2, 4):
+            assert pipelined_hash_flash(begin, length, 0x1000, depth) == hash_flash(
+                begin, length, 0x1000), ('hash_flash short read', depth)
+            assert pipelined_crc32_flash(begin, length, 0x1000, depth) == crc32_flash(
+                begin, length, 0x1000), ('crc32_flash short read', depth)
+        app = KbootAppSector(0x80000)
+        assert pipelined_kboot_app(0x80000) == (
+            app.hdrapp_sha256, app.app_sha256, app.app_crc32, app.app_size), 'KbootAppSector'
+
+        length, block_size = 2**23, 2**20
+        began = perf_counter()
+        hashcrc_flash(0, length, block_size)
+        hashing = perf_counter() - began
+
+        utils = SimulatedFlash(realtime=True, call_latency_us=0, bytes_per_sec=int(length / hashing))
+        serial, pipelined = [], []
+        for i in range(3):
+            began = perf_counter()
+            expected = hashcrc_flash(0, length, block_size)
+            serial.append(perf_counter() - began)
+            began = perf_counter()
+            assert pipelined_hashcrc_flash(0, length, block_size, depth=4) == expected, 'realtime'
+            pipelined.append(perf_counter() - began)
+    finally:
+        utils = backend
+
+    if verbose:
+        print('%-26s serial: %.3fs  pipelined: %.3fs  ratio: %.2f' % (
+            'pipelined_hashcrc realtime', min(serial), min(pipelined), min(pipelined) / min(serial)))
+    if check_overlap:
+        assert min(pipelined) < 0.85 * min(serial), 'pipelined %.3fs did not overlap serial %.3fs' % (
+            min(pipelined), min(serial))
+
+    return min(serial), min(pipelined)
+
+
+def check_kboot_simulation(flash=None):
+    '''
+    asserts that simulate_kboot.py reads only from its backend, not from utils,
+    and that every combination of checks boots a valid firmware
+    '''
+
+    import sys
+
+    global utils
+
+    class Quiet:
+        def write(self, text):
+            pass
+
+    if flash is None:
+        flash = SimulatedFlash(firmwares={0x80000: 1500003})
+
+    backend = utils
+    utils = SimulatedFlash(firmwares={0x80000: 1400000}, seed=0)
+    stdout, sys.stdout = sys.stdout, Quiet()
+    try:
+        steps = compare_kboot_checks(0x80000, backend=flash)
+        simulation = KbootBootSimulation(backend=flash)
+    finally:
+        sys.stdout = stdout
+        utils = backend
+
+    assert [x.result for x in steps] == ['booted'] * 8, [x.result for x in steps]
+    assert simulation.booted and simulation.booted.entry.app_address == 0x80000, str(simulation)
+    assert simulation.totals()[1] == sum([x.bytes_read for x in simulation.steps]) + 2 * 4096, (
+        'config sector reads are not in totals')
+
+
+def check_flash_monitor(flash=None):
+    '''
+    asserts that SPIFlashMonitor reports exactly the sectors written, even with a flash cache installed
+    '''
+
+    global utils
+
+    if flash is None:
+        flash = SimulatedFlash()
+
+    backend = utils
+    utils = flash
+    try:
+        install_flash_cache()
+        monitor = SPIFlashMonitor(regions=((0x4000, 0x2000), (0xd00000, 0x4000)))
+        assert monitor.rescan() == [], 'nothing was written'
+        flash.corrupt(0x5000)
+        flash.corrupt(0xd02000 + 100)
+        assert monitor.rescan() == [0x5000, 0xd02000], monitor.changes
+        assert monitor.rescan() == [], 'writes are reported once'
+    finally:
+        uninstall_flash_cache()
+        utils = backend
+
+
+def check_flash_delta(flash=None):
+    '''
+    asserts that rolling_delta() finds shifted blocks and inplace_rewrite_blocks() only
+    the blocks that changed, including the one holding the new sha256 suffix
+    '''
+
+    global utils
+
+    if flash is None:
+        flash = SimulatedFlash(firmwares={0x80000: 200000})
+
+    backend = utils
+    utils = flash
+    try:
+        app = flash.flash_read(0x80000 + 5, flash.apps[0x80000])
+        shifted = app[:1000] + b'krux' + app[1000:]
+        delta, matched, literal, blocks = slot_delta(0x80000, shifted, verbose=False)
+        assert apply_delta(app, delta) == shifted, 'delta does not rebuild target'
+        assert literal < 2 * 2048, '%d literal bytes for a 4-byte insert' % literal
+
+        patched = bytearray(app)
+        patched[0x10000] ^= 0xff
+        suffix_block = (5 + len(app)) // 0x10000 * 0x10000
+        assert inplace_rewrite_blocks(0x80000, bytes(patched)) == [
+            0x80000 + 0x10000, 0x80000 + suffix_block], 'unexpected blocks to rewrite'
+        assert inplace_rewrite_blocks(0x80000, app) == [], 'unchanged firmware needs no rewrite'
+    finally:
+        utils = backend
+
+
+def check_carve_flash_dump(flash=None):
+    '''
+    asserts that carve_flash_dump() finds every Kboot artifact of a saved SimulatedFlash,
+    and removes the kfpkg once an application's sha256 suffix is corrupted -- in flash,
+    which is left that way.
+    '''
+
+    from os.path import exists, join
+    from shutil import rmtree
+    from tempfile import mkdtemp
+
+    if flash is None:
+        flash = SimulatedFlash(firmwares={0x80000: 150000, 0x280000: 140000})
+
+    temp = mkdtemp()
+    dump, output, kfpkg = join(temp, 'k210.flash_dump'), join(temp, 'carved'), join(temp, 'carved.kfpkg')
+    try:
+        flash.save(dump)
+        results = carve_flash_dump(dump, output, kfpkg, verbose=False)
+        assert [x[0] for x in results] == ['bootloader_lo.bin', 'bootloader_hi.bin', 'config.bin',
+            'config_backup.bin', 'firmware_slot1.bin', 'firmware_slot2.bin'], results
+        assert [x[4] for x in results] == [True, True, None, None, True, True], results
+        assert exists(kfpkg), 'kfpkg of valid applications was removed'
+        with open(join(output, 'firmware_slot1.bin'), 'rb') as f:
+            assert f.read() == flash.flash_read(0x80000 + 5, flash.apps[0x80000]), 'firmware_slot1.bin'
+
+        flash.corrupt(0x80000 + 5 + flash.apps[0x80000])
+        flash.save(dump)
+        results = carve_flash_dump(dump, output + '.zip', kfpkg, verbose=False)
+        assert [x[4] for x in results if x[0] == 'firmware_slot1.bin'] == [False], results
+        assert not exists(kfpkg), 'kfpkg of a corrupted application was kept'
+    finally:
+        rmtree(temp)
+
+
+def check_strings_flash(flash=None):
+    '''
+    asserts that strings_flash() on a device finds what strings_dump() finds in a saved dump,
+    and that StringsIndex lists byte-identical dumps under each of their names;
+    a version string is written into flash first.
+    '''
+
+    from os.path import join
+    from shutil import rmtree
+    from tempfile import mkdtemp
+
+    global utils
+
+    if flash is None:
+        flash = SimulatedFlash(firmwares={0x80000: 150000})
+    begin, length = 0x80000, 0x20000
+    flash.write(begin + 0x100, b'\x00krux v24.03.0\x00')
+    # non-printable edges, so that no run is cut short by the scanned range
+    flash.write(begin, b'\x00')
+    flash.write(begin + length - 1, b'\x00')
+
+    temp = mkdtemp()
+    dump = join(temp, 'k210.flash_dump')
+    backend = utils
+    utils = flash
+    try:
+        flash.save(dump)
+        found = list(strings_flash(begin, length))
+        assert found == [x for x in strings_dump(dump) if begin <= x[0] < begin + length], 'strings differ'
+        assert (begin + 0x101, 'krux v24.03.0') in found, 'planted version string'
+
+        index = StringsIndex(join(temp, 'strings.sqlite'))
+        index.add_dump(dump, 'amigo')
+        index.add_dump(dump, 'dock')
+        assert index.dumps_containing('v24.03.0') == ['amigo', 'dock'], index.dumps_containing('v24.03.0')
+        index.add_dump(dump, 'dock', min_length=20)
+        assert index.dumps_containing('v24.03.0') == ['amigo'], 'dock was not rescanned'
+        index.db.close()
+    finally:
+        utils = backend
+        rmtree(temp)
+
+
+if __name__ == '__main__':
+
+    import sys
+    from os.path import dirname, join
+
+    tools = [
+        'mocked_Maix_utils.py',
+        'decremented_bool.py',
+        'hash_flash.py',
+        'crc32_flash.py',
+        'hashcrc_flash.py',
+        'all_bytes_are.py',
+        'validate_aes_size_app_sha_nulpad.py',
+        'analyze_spi_flash.py',
+        'hex_dump.py',
+        'kboot_classes.py',
+        'cached_flash.py',
+        'pipelined_flash.py',
+        'profile_flash.py',
+        'simulate_kboot.py',
+        'simulated_flash.py',
+        'monitor_flash.py',
+        'delta_flash.py',
+        'carve_flash_dump.py',
+        'strings_flash.py',
+        'benchmark_flash.py',
+    ]
+
+    # as if pasted into the k210 console: one shared namespace, none of the files as __main__
+    console = {'__name__': 'k210comb'}
+    for name in tools:
+        with open(join(dirname(__file__) or '.', name)) as f:
+            exec(f.read(), console)
+
+    console['benchmark_flash']()
+    console['benchmark_heap']()
+    console['benchmark_pipelined'](check_overlap='--check-overlap' in sys.argv)
+    console['check_kboot_simulation']()
+    console['check_flash_monitor']()
+    console['check_flash_delta']()
+    console['check_carve_flash_dump']()
+    console['check_strings_flash']()
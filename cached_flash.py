@@ -0,0 +1,156 @@
+'''
+a read-coalescing block cache to sit under utils.flash_read(), shared by all tools
+
+Reads are aligned to 4096-byte sectors and recent sectors are kept in a small LRU,
+so header, suffix and padding reads repeated across tools, or within analyze_spi_flash(),
+become nearly free.  A single pass such as validate_aes_size_app_sha_nulpad() still
+reads its application once and mostly saves its padding reads.  Sectors missing
+from a request are fetched in as few backend reads as possible -- adjacent ones are
+merged into one large read -- and a miss also reads ahead the following sectors, so
+consecutive small reads, ie: all_bytes_are() in 4096-byte steps, share one backend read.
+Reads larger than the cache go straight to the backend, keeping only their first and
+last sectors, the ones usually read again.  The default capacity of 8 sectors (32KiB)
+suits the k210 heap; on a computer, a capacity of 32 also holds 0x10000 block reads,
+ie: of hash_flash() and KbootAppSector, cached "cold" and evicted first, so streaming
+through an application does not push out its header, suffix and padding.
+
+ie: `install_flash_cache()` then use any tool as usual, `print(utils)` for counters,
+and `uninstall_flash_cache()` to restore the original utils.
+
+assumes that utils.flash_read() behaves as if imported from Maix:
+ie: `from Maix import utils`
+'''
+
+
+class CachedFlashUtils:
+    sector_size = 0x1000
+    flash_size = 2**24
+
+    def __init__(self, backend, capacity=8, readahead=4):
+        self.backend = backend
+        self.capacity = capacity
+        self.readahead = readahead
+        self.invalidate()
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.backend_reads = 0
+        self.backend_bytes = 0
+
+    def invalidate(self):
+        '''
+        forgets all cached sectors, ie: after flash has been written
+        '''
+        self.sectors = {}
+        self.hot = []
+        self.cold = []
+
+    def remember(self, sector, raw_bytes, hot=True):
+        '''
+        caches a sector; cold sectors, from block-sized reads, are evicted before hot ones,
+        so streaming through flash does not push out small metadata reads.
+        '''
+        if sector in self.hot:
+            self.hot.remove(sector)
+            hot = True
+        elif sector in self.cold:
+            self.cold.remove(sector)
+        (self.hot if hot else self.cold).append(sector)
+        self.sectors[sector] = raw_bytes
+        while len(self.hot) + len(self.cold) > self.capacity:
+            del self.sectors[self.cold.pop(0) if self.cold else self.hot.pop(0)]
+
+    def read_backend(self, address, length):
+        self.backend_reads += 1
+        self.backend_bytes += length
+        return self.backend.flash_read(address, length)
+
+    def flash_read(self, address, length):
+        if length <= 0:
+            return b''
+        size = self.sector_size
+        first = address // size
+        last = (address + length - 1) // size
+        small = last - first < self.readahead
+
+        if last - first + 1 > self.capacity:
+            self.bypassed += 1
+            answer = self.read_backend(address, length)
+            if address % size == 0:
+                self.remember(first, answer[:size], hot=False)
+            if (address + length) % size == 0:
+                self.remember(last, answer[-size:], hot=False)
+            return answer
+
+        # fetch each run of adjacent missing sectors with a single backend read,
+        # reading ahead after small reads so that the next ones will hit
+        parts = []
+        sector = first
+        while sector <= last:
+            if sector in self.sectors:
+                self.hits += 1
+                parts.append(self.sectors[sector])
+                self.remember(sector, parts[-1], hot=small)
+                sector += 1
+                continue
+            run = sector
+            while run <= last and run not in self.sectors:
+                run += 1
+            self.misses += run - sector
+            fetch = run
+            if small and run > last:
+                while (fetch < sector + self.readahead and fetch < self.flash_size // size
+                        and fetch not in self.sectors):
+                    fetch += 1
+            raw_bytes = self.read_backend(sector * size, fetch * size - sector * size)
+            for i in range(sector, fetch):
+                block = raw_bytes[(i - sector) * size:(i - sector + 1) * size]
+                if i < run:
+                    parts.append(block)
+                self.remember(i, block, hot=small)
+            sector = run
+
+        offset = address - first * size
+        if first == last:
+            return parts[0][offset:offset+length]
+        return b''.join(parts)[offset:offset+length]
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def __str__(self):
+        return 'CachedFlashUtils hits: {}, misses: {}, bypassed: {}, backend reads: {} ({} bytes), cached: {}'.format(
+            self.hits,
+            self.misses,
+            self.bypassed,
+            self.backend_reads,
+            self.backend_bytes,
+            [hex(x * self.sector_size) for x in sorted(self.sectors)]
+        )
+
+
+def install_flash_cache(capacity=8, readahead=4):
+    '''
+    puts a CachedFlashUtils of capacity sectors under utils.flash_read(), returning it
+    '''
+
+    global utils
+
+    if not isinstance(utils, CachedFlashUtils):
+        utils = CachedFlashUtils(utils, capacity, readahead)
+    return utils
+
+
+def uninstall_flash_cache():
+    '''
+    restores the utils that was cached by install_flash_cache()
+    '''
+
+    global utils
+
+    if isinstance(utils, CachedFlashUtils):
+        utils = utils.backend
+    return utils
@@ -0,0 +1,141 @@
+'''
+carves bootloader, config and firmware files, and a ktool .kfpkg, out of a flash_dump
+
+Instead of `dd` with offsets printed by analyze_spi_flash(), the Kboot layout is
+discovered from the dump itself: both bootloader stages, main and backup configs, and
+every firmware referenced by a config entry (or at the default 0x10000).  Artifacts
+are then streamed in address order, straight from the mmapped dump to files or a zip,
+while each ktool-format application is checked against its embedded sha256 suffix.
+
+ie: `carve_flash_dump('/tmp/k210.flash_dump', '/tmp/k210_carved')`
+
+assumes that kboot_classes.py has been pasted; intended for a computer, not a k210 device.
+'''
+
+
+from binascii import hexlify
+from hashlib import sha256
+from json import dumps
+from mmap import mmap, ACCESS_READ
+from os import makedirs, remove
+from os.path import join
+from zipfile import ZipFile, ZIP_DEFLATED
+
+
+FIRMWARE_NAMES = {
+    0x10000: 'default_app.bin',
+    0x80000: 'firmware_slot1.bin',
+    0x280000: 'firmware_slot2.bin',
+    0x800000: 'firmware_slot3.bin',
+}
+
+
+def discover_kboot_artifacts(dump):
+    '''
+    returns a list of tuple(name, address, is_ktool_app) found in dump, in address order
+    '''
+
+    def is_ktool_app(address, min_size, max_size):
+        size = int.from_bytes(dump[address+1:address+5], 'little')
+        return (dump[address] == 0x00 and min_size <= size <= max_size
+            and address + 5 + size + 32 <= len(dump))
+
+    # stage-0 fits its 0x1000 sector, stage-1 the 0x3000 before the main config
+    artifacts = [(name, address, True) for name, address, sector_size in (
+        ('bootloader_lo.bin', KbootConstants.STAGE0_ADDRESS, 0x1000),
+        ('bootloader_hi.bin', KbootConstants.STAGE1_ADDRESS, 0x3000),
+    ) if is_ktool_app(address, 1, sector_size - 37)]
+
+    addresses = []
+    for name, address in (('config.bin', KbootConstants.MAIN_CONFIG_ADDRESS),
+                          ('config_backup.bin', KbootConstants.BACKUP_CONFIG_ADDRESS)):
+        try:
+            config = KbootConfigSector.from_bytes(bytes(dump[address:address+4096]))
+        except ValueError:
+            continue
+        artifacts.append((name, address, False))
+        addresses.extend([x.app_address for x in config.entries])
+
+    for address in sorted(set(addresses + [KbootConstants.APP_ADDRESS_RANGE[0]])):
+        if is_ktool_app(address, *KbootConstants.APP_SIZE_RANGE):
+            artifacts.append((FIRMWARE_NAMES.get(address, 'firmware_{:x}.bin'.format(address)), address, True))
+
+    return sorted(artifacts, key=lambda x: x[1])
+
+
+def carve_flash_dump(dump='/tmp/k210.flash_dump', output='/tmp/k210_carved',
+    kfpkg='/tmp/k210_carved.kfpkg', chunk_size=0x10000, verbose=True):
+    '''
+    writes each artifact to output -- a directory, or a zip when it ends with .zip --
+    and to a ktool kfpkg unless kfpkg is None, in a single pass over the dump.
+
+    returns a list of tuple(name, address, size, sha256, valid); valid is None for configs,
+    which carry no embedded sha256.  When any application is invalid, or none was found, kfpkg is removed.
+    '''
+
+    to_zip = output.endswith('.zip')
+    if to_zip:
+        archive = ZipFile(output, 'w', ZIP_DEFLATED)
+    else:
+        makedirs(output, exist_ok=True)
+    package = ZipFile(kfpkg, 'w', ZIP_DEFLATED) if kfpkg else None
+
+    results = []
+    flash_list = []
+    with open(dump, 'rb') as f:
+        mapped = mmap(f.fileno(), 0, access=ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            for name, address, is_app in discover_kboot_artifacts(view):
+                if is_app:
+                    size = int.from_bytes(view[address+1:address+5], 'little')
+                    begin = address + 5
+                    hdrapp_hash = sha256(view[address:begin])
+                else:
+                    size, begin, hdrapp_hash = 4096, address, None
+                _hash = sha256()
+
+                sinks = [archive.open(name, 'w') if to_zip else open(join(output, name), 'wb')]
+                if package:
+                    sinks.append(package.open(name, 'w'))
+                try:
+                    for cursor in range(begin, begin + size, chunk_size):
+                        chunk = view[cursor:min(cursor + chunk_size, begin + size)]
+                        _hash.update(chunk)
+                        if hdrapp_hash:
+                            hdrapp_hash.update(chunk)
+                        for sink in sinks:
+                            sink.write(chunk)
+                        del chunk
+                finally:
+                    for sink in sinks:
+                        sink.close()
+
+                valid = None
+                if is_app:
+                    valid = hdrapp_hash.digest() == view[begin+size:begin+size+32]
+                results.append((name, address, size, hexlify(_hash.digest()).decode(), valid))
+                flash_list.append({'address': address, 'bin': name, 'sha256Prefix': is_app})
+
+                if verbose:
+                    print('%-20s at %-9s %8s bytes, sha256: %s%s' % (
+                        name, hex(address), size, results[-1][3],
+                        '' if valid is None else ', suffix VALID' if valid else ', suffix INVALID!'))
+        finally:
+            view.release()
+            mapped.close()
+            if to_zip:
+                archive.close()
+
+    if package:
+        package.writestr('flash-list.json', dumps({'version': '0.1.0', 'files': flash_list}, indent=2))
+        package.close()
+        if False in [x[4] for x in results] or not flash_list:
+            remove(kfpkg)
+            if verbose:
+                print('%s was removed, it would flash %s' % (
+                    kfpkg, 'an invalid application' if flash_list else 'nothing'))
+        elif verbose:
+            print('%s lists %s files' % (kfpkg, len(flash_list)))
+
+    return results
@@ -8,6 +8,8 @@ def crc32_flash(begin=0x00, length=2**24, block_size=2**12, verbose=False):
 
     from binascii import hexlify, crc32
 
+    checksum = 0
+
     if verbose:
         print('Calculating CRC32 for %s bytes of flash at %s...' % (length, hex(begin)), end='')
 
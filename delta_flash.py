@@ -0,0 +1,178 @@
+'''
+rsync-style delta between firmware slots, or against release binaries
+
+A plain block-by-block diff fails as soon as content shifts by a single byte.  Here,
+the basis firmware is split into blocks, each with a weak rolling checksum and a strong
+(truncated sha256) hash; the target firmware is then scanned byte-by-byte with the
+rolling checksum so that shifted blocks are still found.  The delta is a list of
+('copy', basis_offset, length) and ('literal', raw_bytes) operations.
+
+inplace_rewrite_blocks() answers the flashing question: which 64KiB blocks of a slot
+must actually be rewritten to upgrade it in place to a new firmware.
+
+ie: `slot_delta(0x80000, 0x280000)` or `slot_delta(0x80000, '/tmp/firmware.bin')`
+
+assumes that kboot_classes.py has been pasted, and that utils.flash_read() behaves
+as if imported from Maix: ie: `from Maix import utils`.  Whole firmwares are held in
+memory, so this is intended for a computer, against mocked_Maix_utils.py.
+'''
+
+
+from hashlib import sha256
+
+
+def firmware_bytes(source):
+    '''
+    returns application bytes from a KbootAppSector address, a firmware.bin path, or bytes
+    '''
+
+    if type(source) == int:
+        app = KbootAppSector(source)
+        return utils.flash_read(source + 5, app.app_size)
+    elif type(source) == str:
+        with open(source, 'rb') as f:
+            return f.read()
+    return bytes(source)
+
+
+def ktool_image(app, block_size=0x10000):
+    '''
+    returns app as ktool writes it: aes byte, size, app, sha256 suffix and null padding
+    '''
+
+    header = b'\x00' + len(app).to_bytes(4, 'little')
+    image = header + app + sha256(header + app).digest()
+    return image + b'\x00' * (-len(image) % block_size)
+
+
+def weak_checksum(block):
+    '''
+    rsync's rolling checksum as tuple(a, b), each 16 bits
+    '''
+
+    a = sum(block) & 0xffff
+    b = sum([(len(block) - i) * x for i, x in enumerate(block)]) & 0xffff
+    return a, b
+
+
+def strong_hash(block):
+    return sha256(block).digest()[:8]
+
+
+def rolling_delta(basis, target, block_size=2048):
+    '''
+    returns tuple(delta, matched bytes, literal bytes) to rebuild target from basis
+    '''
+
+    signatures = {}
+    for offset in range(0, len(basis) - block_size + 1, block_size):
+        block = basis[offset:offset+block_size]
+        a, b = weak_checksum(block)
+        signatures.setdefault(a | b << 16, []).append((strong_hash(block), offset))
+
+    delta = []
+    matched = literal = 0
+
+    def add_literal(begin, end):
+        if end > begin:
+            delta.append(('literal', target[begin:end]))
+
+    pos, literal_start, length = 0, 0, len(target)
+    if length >= block_size:
+        a, b = weak_checksum(target[:block_size])
+    while pos + block_size <= length:
+        match = None
+        candidates = signatures.get(a | b << 16)
+        if candidates:
+            strong = strong_hash(target[pos:pos+block_size])
+            for candidate, offset in candidates:
+                if candidate == strong:
+                    match = offset
+                    break
+
+        if match is not None:
+            add_literal(literal_start, pos)
+            literal += pos - literal_start
+            if delta and delta[-1][0] == 'copy' and delta[-1][1] + delta[-1][2] == match:
+                delta[-1] = ('copy', delta[-1][1], delta[-1][2] + block_size)
+            else:
+                delta.append(('copy', match, block_size))
+            matched += block_size
+            pos += block_size
+            literal_start = pos
+            if pos + block_size <= length:
+                a, b = weak_checksum(target[pos:pos+block_size])
+        else:
+            if pos + block_size < length:
+                out, new = target[pos], target[pos+block_size]
+                a = (a - out + new) & 0xffff
+                b = (b - block_size * out + a) & 0xffff
+            pos += 1
+
+    add_literal(literal_start, length)
+    literal += length - literal_start
+
+    return delta, matched, literal
+
+
+def apply_delta(basis, delta):
+    '''
+    rebuilds target from basis and a delta from rolling_delta()
+    '''
+
+    return b''.join([
+        basis[x[1]:x[1]+x[2]] if x[0] == 'copy' else x[1]
+        for x in delta
+    ])
+
+
+def delta_size(delta):
+    '''
+    size of delta if serialized compactly: 8 bytes per copy, 4 bytes plus data per literal
+    '''
+
+    return sum([8 if x[0] == 'copy' else 4 + len(x[1]) for x in delta])
+
+
+def inplace_rewrite_blocks(address, target, block_size=0x10000):
+    '''
+    returns addresses of block_size blocks that differ between the slot at address
+    and target (application bytes) written there in ktool format
+    '''
+
+    image = ktool_image(target, block_size)
+    return [address + offset
+        for offset in range(0, len(image), block_size)
+        if utils.flash_read(address + offset, block_size) != image[offset:offset+block_size]
+    ]
+
+
+def slot_delta(basis, target, block_size=2048, write_bytes_per_sec=80 * 2**10, verbose=True):
+    '''
+    compares two firmwares, each a slot address, a firmware.bin path, or bytes,
+    returning tuple(delta, matched, literal, rewrite blocks) and printing a report.
+
+    rewrite blocks are only computed when basis is a slot address: those that would
+    need flashing to upgrade that slot in place to target.
+    '''
+
+    old = firmware_bytes(basis)
+    new = firmware_bytes(target)
+    delta, matched, literal = rolling_delta(old, new, block_size)
+    assert apply_delta(old, delta) == new, 'delta does not rebuild target'
+
+    blocks = inplace_rewrite_blocks(basis, new) if type(basis) == int else []
+
+    if verbose:
+        print('%s bytes -> %s bytes: matched %s, literal %s (%.1f%%), delta %s bytes in %s operations' % (
+            len(old), len(new), matched, literal, 100.0 * literal / max(len(new), 1),
+            delta_size(delta), len(delta)))
+        if type(basis) == int:
+            image_blocks = len(ktool_image(new)) // 0x10000
+            print('in place at %s: %s of %s 64KiB blocks to rewrite, ~%.1fs instead of ~%.1fs at %s bytes/s' % (
+                hex(basis), len(blocks), image_blocks,
+                len(blocks) * 0x10000 / write_bytes_per_sec,
+                image_blocks * 0x10000 / write_bytes_per_sec,
+                write_bytes_per_sec))
+
+    return delta, matched, literal, blocks
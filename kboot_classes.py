@@ -117,7 +117,7 @@ class KbootConfigSector:
         reserved=0,
         user_data=0
     ):
-        if 0 <= len(entries) <= 8 and set([type(x)==KbootConfigEntry for x in entries]) == set([True]):
+        if 0 <= len(entries) <= 8 and all([type(x)==KbootConfigEntry for x in entries]):
             self.entries = entries
         else:
             raise ValueError('entries must be of type KbootConfigEntry and of length 0-8')
@@ -10,6 +10,11 @@ class MockedMaixUtils:
               f.seek(address)
               return f.read(length)
 
+     def flash_readinto(self, address, buffer):
+         with open('/tmp/k210.flash_dump', 'rb') as f:
+              f.seek(address)
+              return f.readinto(buffer)
+
 try: from Maix import utils
 except: utils = MockedMaixUtils()
 
@@ -0,0 +1,115 @@
+'''
+monitors which SPI Flash sectors get written, ie: while krux saves settings
+
+A baseline crc32 of every 4096-byte sector in the watched regions is held in a compact
+array('I') -- 4 bytes per sector, 3KB for all of SPIFFS -- then rescan() rechecks only
+those regions, several sectors per flash_read(), and records each changed sector with
+a timestamp.  watch() rescans periodically until interrupted with <CTRL>-c.
+
+ie: `m = SPIFlashMonitor()`, save settings in krux, then `m.rescan()` or `m.watch(10)`
+
+assumes that utils.flash_read() behaves as if imported from Maix,
+ie: `from Maix import utils`
+'''
+
+
+from array import array
+from binascii import crc32
+from time import sleep, time
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import perf_counter
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+    def ticks_diff(end, start):
+        return end - start
+
+
+class SPIFlashMonitor:
+    sector_size = 0x1000
+
+    def __init__(self,
+        regions=((0x4000, 0x2000), (0xd00000, 0x300000)),
+        sectors_per_read=4,
+        verbose=False
+    ):
+        for begin, length in regions:
+            if begin % self.sector_size or length % self.sector_size:
+                raise ValueError('regions must begin and end on 4096-byte aligned sectors')
+        self.regions = regions
+        self.sectors_per_read = sectors_per_read
+        self.verbose = verbose
+        self.crcs = array('I', [0] * sum([x[1] // self.sector_size for x in regions]))
+        self.changes = []
+        self.rescans = 0
+        self.last_scan_ms = 0
+        self.scan(baseline=True)
+
+    def scan(self, baseline=False):
+        '''
+        recomputes crc32 of every watched sector, returning addresses that changed
+
+        a cache under utils, ie: from install_flash_cache(), is invalidated first,
+        so that sectors are read from flash rather than as they were last cached.
+        '''
+
+        if hasattr(utils, 'invalidate'):
+            utils.invalidate()
+        began = ticks_ms()
+        now = time()
+        changed = []
+        index = 0
+        for begin, length in self.regions:
+            cursor = begin
+            while cursor < begin + length:
+                size = min(self.sectors_per_read * self.sector_size, begin + length - cursor)
+                view = memoryview(utils.flash_read(cursor, size))
+                for offset in range(0, size, self.sector_size):
+                    checksum = crc32(view[offset:offset+self.sector_size])
+                    if not baseline and checksum != self.crcs[index]:
+                        changed.append(cursor + offset)
+                        self.changes.append((now, cursor + offset))
+                    self.crcs[index] = checksum
+                    index += 1
+                cursor += size
+        self.last_scan_ms = ticks_diff(ticks_ms(), began)
+        return changed
+
+    def rescan(self):
+        '''
+        rescans watched regions against the last scan, returning and printing changed sectors
+        '''
+
+        changed = self.scan()
+        self.rescans += 1
+        if changed or self.verbose:
+            print('rescan %s at %s took %sms, %s changed sectors: %s' % (
+                self.rescans, self.changes[-1][0] if changed else time(), self.last_scan_ms,
+                len(changed), [hex(x) for x in changed]))
+        return changed
+
+    def watch(self, period=5, count=None):
+        '''
+        rescans every period seconds, count times or until <CTRL>-c
+        '''
+
+        try:
+            while count is None or count > 0:
+                sleep(period)
+                self.rescan()
+                if count is not None:
+                    count -= 1
+        except KeyboardInterrupt:
+            pass
+        return self.changes
+
+    def __str__(self):
+        return 'SPIFlashMonitor regions: {}, sectors: {}, rescans: {}, last scan: {}ms, changes:\n  {}'.format(
+            ', '.join(['{}+{}'.format(hex(x), hex(y)) for x, y in self.regions]),
+            len(self.crcs),
+            self.rescans,
+            self.last_scan_ms,
+            '\n  '.join(['{}: {}'.format(x, hex(y)) for x, y in self.changes])
+        )
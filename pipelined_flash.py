@@ -0,0 +1,161 @@
+'''
+overlapped read/hash pipeline for hashing flash on a computer
+
+The usual tools are strictly serial: read a block, hash it, read the next.  Here,
+a reader thread fills a ring of depth reusable buffers while the caller hashes,
+and because hashlib and binascii.crc32 release the GIL on large buffers, a slow
+backend (disk, network mount, serial transport) and hashing overlap.
+Results are identical to hash_flash(), crc32_flash(), hashcrc_flash() and KbootAppSector.
+
+When utils has flash_readinto(address, buffer), buffers are filled in place,
+otherwise each flash_read() is copied into its buffer.
+
+assumes that utils.flash_read() behaves as if imported from Maix:
+ie: `from Maix import utils`; intended for a computer, not a k210 device.
+'''
+
+
+from binascii import crc32, hexlify
+from hashlib import sha256
+from queue import Queue
+from threading import Thread
+
+
+def pipelined_flash_blocks(begin, length, block_size=2**16, depth=4):
+    '''
+    yields memoryviews of consecutive blocks of flash, between begin and begin+length,
+    read ahead by up to depth blocks.  Each memoryview is reused once the next is requested.
+    A short read, past the end of a flash_dump, is yielded as such and ends the blocks.
+    '''
+
+    ring = [bytearray(block_size) for i in range(max(depth, 2))]
+    free, full = Queue(), Queue()
+    for slot in range(len(ring)):
+        free.put(slot)
+    stopping = []
+
+    def reader():
+        try:
+            bytes_read = 0
+            while bytes_read < length:
+                slot = free.get()
+                if stopping:
+                    return
+                size = min(block_size, length - bytes_read)
+                view = memoryview(ring[slot])[:size]
+                if hasattr(utils, 'flash_readinto'):
+                    n = utils.flash_readinto(begin + bytes_read, view)
+                else:
+                    some_bytes = utils.flash_read(begin + bytes_read, size)
+                    n = len(some_bytes)
+                    view[:n] = some_bytes
+                if n:
+                    full.put((slot, n))
+                bytes_read += n
+                if n < size:
+                    # end of the dump: serial tools hash the short read, then only b''
+                    break
+            full.put((None, 0))
+        except Exception as err:
+            full.put((None, err))
+
+    thread = Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            slot, size = full.get()
+            if slot is None:
+                if isinstance(size, Exception):
+                    raise size
+                return
+            yield memoryview(ring[slot])[:size]
+            free.put(slot)
+    finally:
+        stopping.append(True)
+        free.put(None)
+        thread.join()
+
+
+def pipelined_hashcrc_flash(begin=0x00, length=2**24, block_size=2**16, depth=4, verbose=False):
+    '''
+    SHA256 Hash and CRC32 of the entirety, or from begin to begin+length, of SPI Flash memory,
+    same as hashcrc_flash(), with reading and hashing overlapped.
+    '''
+
+    _hash = sha256()
+    checksum = 0
+
+    if verbose:
+        print('Pipelined hashing and CRCsumming %s bytes of flash at %s, depth %s...' % (
+            length, hex(begin), depth), end='')
+
+    bytes_read = 0
+    for some_bytes in pipelined_flash_blocks(begin, length, block_size, depth):
+        _hash.update(some_bytes)
+        checksum = crc32(some_bytes, checksum)
+        bytes_read += len(some_bytes)
+
+        if verbose:
+            print('.', end='')
+
+    answer = _hash.digest(), checksum
+
+    if verbose:
+        print('\n%s bytes at %s:\n sha256: %s\n crc32: %s' % (
+            bytes_read, hex(begin), hexlify(answer[0]).decode(), answer[1]
+        ))
+
+    return answer
+
+
+def pipelined_hash_flash(begin=0x00, length=2**24, block_size=2**16, depth=4):
+    '''
+    same as hash_flash(), with reading and hashing overlapped
+    '''
+
+    _hash = sha256()
+    for some_bytes in pipelined_flash_blocks(begin, length, block_size, depth):
+        _hash.update(some_bytes)
+    return _hash.digest()
+
+
+def pipelined_crc32_flash(begin=0x00, length=2**24, block_size=2**16, depth=4):
+    '''
+    same as crc32_flash(), with reading and hashing overlapped
+    '''
+
+    checksum = 0
+    for some_bytes in pipelined_flash_blocks(begin, length, block_size, depth):
+        checksum = crc32(some_bytes, checksum)
+    return checksum
+
+
+def pipelined_kboot_app(address, block_size=2**16, depth=4):
+    '''
+    returns tuple(hdrapp_sha256, app_sha256, app_crc32, app_size) of the ktool-format
+    application at address, same as KbootAppSector's attributes, with reading and hashing overlapped.
+
+    raises ValueError when the AES byte is not 0x00 or the sha256 suffix does not match;
+    unlike KbootAppSector, whose suffix check builds that ValueError without raising it.
+    '''
+
+    header = utils.flash_read(address, 5)
+    if header[0:1] != b'\x00':
+        raise ValueError('AES byte in header at {} must be 0x00'.format(hex(address)))
+    app_size = int.from_bytes(header[1:5], 'little')
+
+    hdrapp_hash = sha256(header)
+    app_hash = sha256()
+    app_crc = 0
+    for some_bytes in pipelined_flash_blocks(address + 5, app_size, block_size, depth):
+        hdrapp_hash.update(some_bytes)
+        app_hash.update(some_bytes)
+        app_crc = crc32(some_bytes, app_crc)
+
+    hdrapp_hash = hdrapp_hash.digest()
+    if utils.flash_read(address + 5 + app_size, 32) != hdrapp_hash:
+        raise ValueError('KbootApp at {} is corrupted; calculated sha256 does not match suffix'.format(
+            hex(address)
+        ))
+
+    return hdrapp_hash, app_hash.digest(), app_crc, app_size
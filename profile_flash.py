@@ -0,0 +1,223 @@
+'''
+profiles heap usage, garbage collection and flash reads of the tools in this repo
+
+On a k210 device, gc.mem_alloc() and gc.mem_free() are sampled around every call
+to utils.flash_read(), so high-water marks are as seen from inside the tool.
+On a computer, where gc has neither, tracemalloc and gc.callbacks are used instead,
+typically against the mocked backend from mocked_Maix_utils.py.
+
+assumes that utils.flash_read() behaves as if imported from Maix:
+ie: `from Maix import utils`
+'''
+
+
+import gc
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import perf_counter
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+    def ticks_diff(end, start):
+        return end - start
+
+try:
+    import tracemalloc
+    from sys import getallocatedblocks
+except ImportError:
+    tracemalloc = None
+
+
+class ProfiledUtils:
+    '''
+    wraps a utils-like backend so that every flash_read() is counted and sampled
+    '''
+
+    def __init__(self, backend, profile):
+        self.backend = backend
+        self.profile = profile
+
+    def flash_read(self, address, length):
+        self.profile.sample()
+        answer = self.backend.flash_read(address, length)
+        self.profile.reads += 1
+        self.profile.bytes_read += len(answer)
+        self.profile.sample()
+        return answer
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+class FlashProfile:
+    '''
+    heap, gc and flash_read statistics for a single tool call
+
+    * heap_start, heap_peak and heap_end are bytes allocated on the heap,
+    * heap_free_low is the lowest gc.mem_free() seen (k210 only, else None),
+    * reads counts flash_read() calls, each allocating a new buffer,
+    * on a computer, blocks_peak is the most heap blocks live at once beyond those at start,
+      allocations sums the heap blocks gained between consecutive samples -- a lower bound,
+      as blocks allocated and freed between two samples are missed, yet every flash_read()
+      buffer is counted -- and blocks_retained is the number of blocks allocated during
+      the call and still live at its end, from tracemalloc snapshots; all are None on a k210 device,
+    * collections and gc_pause_ms are exact on a computer; on a k210 device, collections
+      are inferred from gc.mem_alloc() dropping between samples and gc_pause_ms is None,
+    * cleanup_ms is the final gc.collect() after the tool on a k210 device (else None),
+      the cost of cleaning up after it rather than a pause during it.
+    '''
+
+    on_device = hasattr(gc, 'mem_alloc')
+
+    def __init__(self, name):
+        self.name = name
+        self.reads = 0
+        self.bytes_read = 0
+        self.heap_start = 0
+        self.heap_peak = 0
+        self.heap_end = 0
+        self.heap_free_low = None
+        self.blocks_start = 0
+        self.blocks_peak = None
+        self.allocations = None
+        self.blocks_retained = None
+        self.collections = 0
+        self.gc_pause_ms = None if self.on_device else 0
+        self.cleanup_ms = None
+        self.elapsed_ms = 0
+        self.error = None
+        self._last_alloc = 0
+        self._last_blocks = 0
+        self._gc_started = None
+        self._started_tracing = False
+        self._ticks = 0
+        self._snapshot = None
+
+    def sample(self):
+        if not self.on_device:
+            if self.blocks_peak is not None:
+                blocks = getallocatedblocks()
+                self.blocks_peak = max(self.blocks_peak, blocks - self.blocks_start)
+                self.allocations += max(blocks - self._last_blocks, 0)
+                self._last_blocks = blocks
+            return
+        alloc, free = gc.mem_alloc(), gc.mem_free()
+        if alloc < self._last_alloc:
+            self.collections += 1
+        self._last_alloc = alloc
+        if alloc > self.heap_peak:
+            self.heap_peak = alloc
+        if self.heap_free_low is None or free < self.heap_free_low:
+            self.heap_free_low = free
+
+    def _gc_callback(self, phase, info):
+        if phase == 'start':
+            self._gc_started = ticks_ms()
+        elif self._gc_started is not None:
+            self.collections += 1
+            self.gc_pause_ms += ticks_diff(ticks_ms(), self._gc_started)
+            self._gc_started = None
+
+    def start(self):
+        gc.collect()
+        if self.on_device:
+            self.heap_start = self._last_alloc = self.heap_peak = gc.mem_alloc()
+            self.heap_free_low = gc.mem_free()
+        elif tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            # the start snapshot is taken first, so that it is not measured as the tool's
+            self._snapshot = tracemalloc.take_snapshot()
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.heap_start = tracemalloc.get_traced_memory()[0]
+            self.blocks_peak, self.allocations = 0, 0
+            self.blocks_start = self._last_blocks = getallocatedblocks()
+            gc.callbacks.append(self._gc_callback)
+        self._ticks = ticks_ms()
+
+    def stop(self):
+        self.elapsed_ms = ticks_diff(ticks_ms(), self._ticks)
+        if self.on_device:
+            self.sample()
+            self.heap_end = gc.mem_alloc()
+            began = ticks_ms()
+            gc.collect()
+            self.cleanup_ms = ticks_diff(ticks_ms(), began)
+        elif tracemalloc:
+            gc.callbacks.remove(self._gc_callback)
+            self.sample()
+            self.heap_end, self.heap_peak = tracemalloc.get_traced_memory()
+            self.blocks_retained = sum([max(x.count_diff, 0)
+                for x in tracemalloc.take_snapshot().compare_to(self._snapshot, 'lineno')
+                if x.traceback[0].filename != tracemalloc.__file__])
+            self._snapshot = None
+            if self._started_tracing:
+                tracemalloc.stop()
+
+    def __str__(self):
+        return '{}: {}{}ms, reads: {} ({} bytes), heap start: {}, peak: {} (+{}), end: {}{}{}, gc: {}{}{}'.format(
+            self.name,
+            'FAILED {}, '.format(self.error) if self.error else '',
+            self.elapsed_ms,
+            self.reads,
+            self.bytes_read,
+            self.heap_start,
+            self.heap_peak,
+            self.heap_peak - self.heap_start,
+            self.heap_end,
+            ', free-low: {}'.format(self.heap_free_low) if self.heap_free_low is not None else '',
+            ', blocks peak: +{}, allocations: {}, retained: {}'.format(
+                self.blocks_peak, self.allocations, self.blocks_retained)
+                if self.allocations is not None else '',
+            self.collections,
+            ' in {}ms'.format(self.gc_pause_ms) if self.gc_pause_ms is not None else '',
+            ', cleanup: {}ms'.format(self.cleanup_ms) if self.cleanup_ms is not None else ''
+        )
+
+
+flash_profiles = []
+
+
+def profile_flash(func, *args, **kwargs):
+    '''
+    calls func(*args, **kwargs) with utils.flash_read() profiled,
+    prints a one-line summary -- even if func raised MemoryError,
+    and returns tuple(func's answer, FlashProfile).
+
+    ie: `profile_flash(hash_flash, 0x80000, 0x200000)`
+
+    every FlashProfile is also kept in flash_profiles, see print_flash_profiles().
+    '''
+
+    global utils
+
+    profile = FlashProfile(getattr(func, '__name__', str(func)))
+    flash_profiles.append(profile)
+    backend = utils
+    utils = ProfiledUtils(backend, profile)
+    profile.start()
+    try:
+        answer = func(*args, **kwargs)
+    except Exception as err:
+        profile.error = type(err).__name__
+        raise
+    finally:
+        utils = backend
+        profile.stop()
+        print(profile)
+
+    return answer, profile
+
+
+def print_flash_profiles(clear=False):
+    '''
+    prints the summaries of all profiled tool calls, optionally forgetting them
+    '''
+
+    for profile in flash_profiles:
+        print(profile)
+    if clear:
+        del flash_profiles[:]
@@ -0,0 +1,234 @@
+'''
+simulates Kboot's boot path to predict which application would boot, and at what cost
+
+Entries are walked the way Kboot does: main config entries in order, then backup
+config entries, then the default application at 0x10000.  Inactive entries are skipped;
+for active entries, the configured checks (ck_size, ck_crc32, ck_sha256) are run
+against the actual application bytes in flash, and the first entry to pass is booted.
+
+Boot delay is estimated with KbootSpeedModel, whose defaults are rough guesses;
+calibrate them by timing a known boot on a device.
+
+assumes that kboot_classes.py has been pasted, and that utils.flash_read() behaves
+as if imported from Maix: ie: `from Maix import utils`
+'''
+
+
+from binascii import crc32
+from hashlib import sha256
+
+
+class KbootSpeedModel:
+    '''
+    flash-speed and hashing model used to turn bytes into boot delay
+    '''
+
+    def __init__(self,
+        flash_bytes_per_sec=20 * 2**20,
+        sha256_bytes_per_sec=15 * 2**20,
+        crc32_bytes_per_sec=40 * 2**20,
+        read_overhead_us=50,
+        block_size=0x10000
+    ):
+        self.flash_bytes_per_sec = flash_bytes_per_sec
+        self.sha256_bytes_per_sec = sha256_bytes_per_sec
+        self.crc32_bytes_per_sec = crc32_bytes_per_sec
+        self.read_overhead_us = read_overhead_us
+        self.block_size = block_size
+
+    def delay_ms(self, reads, bytes_read, sha256_bytes, crc32_bytes):
+        return (
+            reads * self.read_overhead_us / 1000
+            + bytes_read * 1000 / self.flash_bytes_per_sec
+            + sha256_bytes * 1000 / self.sha256_bytes_per_sec
+            + crc32_bytes * 1000 / self.crc32_bytes_per_sec
+        )
+
+
+class KbootBootStep:
+    '''
+    the outcome and cost of Kboot considering a single config entry
+    '''
+
+    def __init__(self, config_name, entry):
+        self.config_name = config_name
+        self.entry = entry
+        self.result = None
+        self.reads = 0
+        self.bytes_read = 0
+        self.sha256_bytes = 0
+        self.crc32_bytes = 0
+        self.delay_ms = 0
+
+    def __str__(self):
+        return '{} {}: {}, reads: {}, bytes read: {}, sha256: {}, crc32: {}, ~{:.1f}ms'.format(
+            self.config_name,
+            self.entry.app_name if self.entry else hex(KbootConstants.APP_ADDRESS_RANGE[0]),
+            self.result,
+            self.reads,
+            self.bytes_read,
+            self.sha256_bytes,
+            self.crc32_bytes,
+            self.delay_ms
+        )
+
+
+class KbootBootSimulation:
+    '''
+    walks a main (and optionally backup) KbootConfigSector against a flash backend
+
+    When main or backup are None, they are read from flash; a config sector which
+    does not parse is treated as having no entries.  Those reads are charged to
+    config_reads and config_bytes_read, and included in totals().  backend defaults to utils.
+    '''
+
+    def __init__(self, main=None, backup=None, backend=None, model=None, verbose=False):
+        self.backend = backend if backend is not None else utils
+        self.model = model if model is not None else KbootSpeedModel()
+        self.verbose = verbose
+        self.steps = []
+        self.booted = None
+        self.config_reads = 0
+        self.config_bytes_read = 0
+
+        if main is None:
+            main = self.read_config(KbootConstants.MAIN_CONFIG_ADDRESS)
+        if backup is None:
+            backup = self.read_config(KbootConstants.BACKUP_CONFIG_ADDRESS)
+
+        for config_name, config in (('main', main), ('backup', backup)):
+            for entry in (config.entries if config else []):
+                if self.try_entry(config_name, entry):
+                    return
+
+        default = KbootConfigEntry(KbootConstants.APP_ADDRESS_RANGE[0], ck_sha256=True)
+        self.try_entry('default', default, is_default=True)
+
+    def read_config(self, address):
+        self.config_reads += 1
+        self.config_bytes_read += 4096
+        try:
+            return KbootConfigSector.from_bytes(self.backend.flash_read(address, 4096))
+        except ValueError:
+            return None
+
+    def read(self, step, address, length):
+        step.reads += 1
+        step.bytes_read += length
+        return self.backend.flash_read(address, length)
+
+    def try_entry(self, config_name, entry, is_default=False):
+        step = KbootBootStep(config_name, None if is_default else entry)
+        self.steps.append(step)
+
+        if not entry.is_active:
+            step.result = 'skipped, not active'
+        else:
+            step.result = self.check_app(step, entry)
+            step.delay_ms = self.model.delay_ms(
+                step.reads, step.bytes_read, step.sha256_bytes, step.crc32_bytes)
+            if step.result == 'booted':
+                self.booted = step
+
+        if self.verbose:
+            print(step)
+        return self.booted is step
+
+    def check_app(self, step, entry):
+        address = entry.app_address
+        header = self.read(step, address, 5)
+        if header[0:1] != b'\x00':
+            return 'failed, AES byte in header is not 0x00'
+
+        app_size = int.from_bytes(header[1:5], 'little')
+        if not KbootConstants.APP_SIZE_RANGE[0] <= app_size <= KbootConstants.APP_SIZE_RANGE[1]:
+            return 'failed, header app_size {} out of range'.format(app_size)
+        if entry.ck_size and app_size != entry.app_size:
+            return 'failed, header app_size {} != {}'.format(app_size, entry.app_size)
+
+        # the application is loaded either way, checks are computed as it streams in
+        hdrapp_hash = sha256(header)
+        app_crc = 0
+        step.sha256_bytes += 5 if entry.ck_sha256 else 0
+        block_size = self.model.block_size
+        bytes_loaded = 0
+        while bytes_loaded < app_size:
+            a_block = self.read(step, address + 5 + bytes_loaded, min(block_size, app_size - bytes_loaded))
+            if entry.ck_sha256:
+                hdrapp_hash.update(a_block)
+                step.sha256_bytes += len(a_block)
+            if entry.ck_crc32:
+                app_crc = crc32(a_block, app_crc)
+                step.crc32_bytes += len(a_block)
+            bytes_loaded += len(a_block)
+
+        if entry.ck_crc32 and app_crc != entry.app_crc32:
+            return 'failed, crc32 {} != {}'.format(app_crc, entry.app_crc32)
+        if entry.ck_sha256:
+            if hdrapp_hash.digest() != self.read(step, address + 5 + app_size, 32):
+                return 'failed, sha256 does not match suffix'
+        return 'booted'
+
+    def config_delay_ms(self):
+        return self.model.delay_ms(self.config_reads, self.config_bytes_read, 0, 0)
+
+    def totals(self):
+        '''
+        returns [reads, bytes read, sha256 bytes, crc32 bytes, delay ms] of configs and steps
+        '''
+        answer = [sum([getattr(x, name) for x in self.steps])
+            for name in ('reads', 'bytes_read', 'sha256_bytes', 'crc32_bytes', 'delay_ms')]
+        answer[0] += self.config_reads
+        answer[1] += self.config_bytes_read
+        answer[4] += self.config_delay_ms()
+        return answer
+
+    def __str__(self):
+        return ('booted: {}\n  configs: reads: {}, bytes read: {}, ~{:.1f}ms\n  {}\n'
+            'totals: reads: {}, bytes read: {}, sha256: {}, crc32: {}, ~{:.1f}ms').format(
+            '{} {}'.format(self.booted.config_name, self.booted.entry or 'default app')
+                if self.booted else 'NOTHING',
+            self.config_reads,
+            self.config_bytes_read,
+            self.config_delay_ms(),
+            '\n  '.join([str(x) for x in self.steps]),
+            *self.totals()
+        )
+
+
+def compare_kboot_checks(address, backend=None, model=None):
+    '''
+    prints the predicted boot delay of the app at address for every combination
+    of ck_size, ck_crc32 and ck_sha256, so verification flags can be chosen with real numbers.
+
+    returns the list of KbootBootStep, one per combination.
+    '''
+
+    backend = backend if backend is not None else utils
+    model = model if model is not None else KbootSpeedModel()
+    block_size = model.block_size
+    app_size = int.from_bytes(backend.flash_read(address + 1, 4), 'little')
+    app_crc32 = 0
+    for offset in range(0, app_size, block_size):
+        app_crc32 = crc32(backend.flash_read(address + 5 + offset, min(block_size, app_size - offset)), app_crc32)
+
+    steps = []
+    for flags in range(8):
+        entry = KbootConfigEntry(
+            address,
+            ck_size=bool(flags & 1),
+            ck_crc32=bool(flags & 2),
+            ck_sha256=bool(flags & 4),
+            app_size=app_size,
+            app_crc32=app_crc32
+        )
+        config = KbootConfigSector(entries=[entry])
+        simulation = KbootBootSimulation(config, KbootConfigSector(entries=[]), backend, model)
+        steps.append(simulation.steps[0])
+        print('{}/{}/{}: {}'.format(
+            'ck_size' if entry.ck_size else 'NO-ck_size',
+            'ck_crc32' if entry.ck_crc32 else 'NO-ck_crc32',
+            'ck_sha256' if entry.ck_sha256 else 'NO-ck_sha256',
+            steps[-1]
+        ))
+    return steps
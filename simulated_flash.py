@@ -0,0 +1,121 @@
+'''
+a synthetic 16MB SPI Flash with a valid Kboot layout, to be used in place of utils
+
+Everything in this repo assumes `from Maix import utils` or a flash_dump in /tmp;
+SimulatedFlash instead generates stage-0, stage-1, main and backup configs, firmware
+in any slots and random bytes at the start of the SPI Flash File System region --
+standing in for files, this is not a mountable SPIFFS image -- lets corruption be
+injected, and models per-call latency and bandwidth while counting every flash_read().
+
+ie: `utils = SimulatedFlash(firmwares={0x80000: 1500000, 0x280000: 1400000})`
+
+assumes that kboot_classes.py has been pasted; intended for a computer, not a k210 device.
+'''
+
+
+from binascii import crc32
+from hashlib import sha256
+from random import Random
+from time import sleep
+
+
+class SimulatedFlash:
+    size = 2**24
+    spiffs_address = 0xd00000
+    spiffs_size = 0x300000
+
+    def __init__(self,
+        firmwares={0x80000: 1500000},
+        stage0_size=3000,
+        stage1_size=6000,
+        spiffs_random_bytes=0x20000,
+        call_latency_us=100,
+        bytes_per_sec=4 * 2**20,
+        realtime=False,
+        seed=210
+    ):
+        self.call_latency_us = call_latency_us
+        self.bytes_per_sec = bytes_per_sec
+        self.realtime = realtime
+        self.random = Random(seed)
+        self.data = bytearray(b'\xff' * self.size)
+        self.apps = {}
+
+        self.write_app(KbootConstants.STAGE0_ADDRESS, self.random_bytes(stage0_size), 0x1000)
+        self.write_app(KbootConstants.STAGE1_ADDRESS, self.random_bytes(stage1_size), 0x1000)
+
+        entries = []
+        for i, address in enumerate(sorted(firmwares)):
+            app = self.random_bytes(firmwares[address])
+            self.write_app(address, app, 0x10000)
+            entries.append(KbootConfigEntry(
+                address,
+                is_active=True,
+                ck_crc32=True,
+                ck_sha256=True,
+                ck_size=True,
+                app_size=len(app),
+                app_crc32=crc32(app),
+                app_name='firmware{}'.format(i + 1)
+            ))
+        self.config = KbootConfigSector(entries=entries)
+        self.write(KbootConstants.MAIN_CONFIG_ADDRESS, self.config.serialize())
+        self.write(KbootConstants.BACKUP_CONFIG_ADDRESS, self.config.serialize())
+
+        self.write(self.spiffs_address, self.random_bytes(spiffs_random_bytes))
+
+        self.reset_counters()
+
+    def random_bytes(self, length):
+        return self.random.getrandbits(8 * length).to_bytes(length, 'little') if length else b''
+
+    def write(self, address, raw_bytes):
+        self.data[address:address+len(raw_bytes)] = raw_bytes
+
+    def write_app(self, address, app, block_size):
+        '''
+        writes app in ktool format: aes byte, size, app, sha256 suffix and null padding
+        '''
+        header = b'\x00' + len(app).to_bytes(4, 'little')
+        sector = header + app + sha256(header + app).digest()
+        sector += b'\x00' * (-len(sector) % block_size)
+        self.write(address, sector)
+        self.apps[address] = len(app)
+
+    def corrupt(self, address, length=1, xor=0xff):
+        '''
+        flips bits of length bytes at address, ie: to break a sha256 suffix or a config entry
+        '''
+        for i in range(address, address + length):
+            self.data[i] ^= xor
+
+    def reset_counters(self):
+        self.reads = 0
+        self.bytes_read = 0
+        self.simulated_us = 0
+
+    def flash_read(self, address, length):
+        self.reads += 1
+        self.bytes_read += length
+        delay_us = self.call_latency_us + length * 1000000 // self.bytes_per_sec
+        self.simulated_us += delay_us
+        if self.realtime:
+            sleep(delay_us / 1000000)
+        return bytes(self.data[address:address+length])
+
+    def flash_readinto(self, address, buffer):
+        some_bytes = self.flash_read(address, len(buffer))
+        buffer[:len(some_bytes)] = some_bytes
+        return len(some_bytes)
+
+    def save(self, path='/tmp/k210.flash_dump'):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+    def __str__(self):
+        return 'SimulatedFlash apps: {}, reads: {}, bytes read: {}, simulated: {:.3f}s'.format(
+            ', '.join(['{}: {}'.format(hex(x), self.apps[x]) for x in sorted(self.apps)]),
+            self.reads,
+            self.bytes_read,
+            self.simulated_us / 1000000
+        )
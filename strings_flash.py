@@ -0,0 +1,188 @@
+'''
+strings-style extraction of printable runs in flash, with a persistent per-dump index
+
+On a k210 device, strings_flash() scans flash in chunks via utils.flash_read().
+On a computer, strings_dump() runs a compiled regular expression over the mmapped
+dump, so printable-run detection happens in C rather than byte-by-byte in python,
+and StringsIndex keeps (dump, offset, region, string) rows in sqlite, so queries like
+"which dumps contain version string X" run across an archive without rescanning.
+
+ie: `idx = StringsIndex()`, `idx.add_dump('/tmp/k210.flash_dump', 'amigo')`,
+then `idx.dumps_containing('v24.03.0')` or `idx.version_markers()`
+
+assumes that utils.flash_read() behaves as if imported from Maix,
+ie: `from Maix import utils`
+'''
+
+
+FLASH_REGIONS = (
+    # begin, name
+    (0x0, 'stage0'),
+    (0x1000, 'stage1'),
+    (0x4000, 'config'),
+    (0x5000, 'backup_config'),
+    (0x6000, 'reserved'),
+    (0x10000, 'default_app'),
+    (0x80000, 'firmware_slot1'),
+    (0x280000, 'firmware_slot2'),
+    (0x800000, 'firmware_slot3'),
+    (0xd00000, 'spiffs'),
+)
+
+VERSION_MARKER = r'(krux|[Vv]ersion|\bv?[0-9]+\.[0-9]+\.[0-9]+)'
+
+
+def flash_region(address):
+    '''
+    returns the name of the SPI Flash region holding address
+    '''
+
+    answer = FLASH_REGIONS[0][1]
+    for begin, name in FLASH_REGIONS:
+        if address >= begin:
+            answer = name
+    return answer
+
+
+def strings_flash(begin=0x00, length=2**24, min_length=6, block_size=2**12):
+    '''
+    yields tuple(address, string) for each run of at least min_length printable
+    ascii bytes in SPI Flash, between begin and begin+length, one block at a time.
+    '''
+
+    run_begin, run = None, []
+    bytes_read = 0
+    while bytes_read < length:
+        some_bytes = utils.flash_read(begin+bytes_read, min(block_size, length - bytes_read))
+        for i, x in enumerate(some_bytes):
+            if 0x20 <= x < 0x7f:
+                if run_begin is None:
+                    run_begin = begin + bytes_read + i
+                run.append(x)
+            elif run_begin is not None:
+                if len(run) >= min_length:
+                    yield run_begin, bytes(run).decode()
+                run_begin, run = None, []
+        bytes_read += len(some_bytes)
+
+    if run_begin is not None and len(run) >= min_length:
+        yield run_begin, bytes(run).decode()
+
+
+def strings_dump(dump='/tmp/k210.flash_dump', min_length=6):
+    '''
+    yields tuple(address, string) for each run of at least min_length printable
+    ascii bytes in a flash_dump file; intended for a computer.
+    '''
+
+    from mmap import mmap, ACCESS_READ
+    from re import compile
+
+    printable = compile(b'[\\x20-\\x7e]{%d,}' % min_length)
+    with open(dump, 'rb') as f:
+        mapped = mmap(f.fileno(), 0, access=ACCESS_READ)
+        try:
+            for match in printable.finditer(mapped):
+                yield match.start(), match.group().decode()
+        finally:
+            mapped.close()
+
+
+class StringsIndex:
+    '''
+    persistent sqlite index of strings across an archive of flash_dumps; computer only
+
+    dumps are kept by name, while their strings are kept by the sha256 of their contents,
+    so byte-identical dumps from several devices are listed separately but scanned once.
+    Substring and pattern searches scan the strings table, which no index can serve,
+    but that is still far cheaper than rescanning every dump.
+    '''
+
+    def __init__(self, path='/tmp/k210_strings.sqlite'):
+        import sqlite3
+        from re import search
+
+        self.db = sqlite3.connect(path)
+        self.db.create_function('REGEXP', 2,
+            lambda pattern, value: value is not None and search(pattern, value) is not None)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS dumps (
+                name TEXT PRIMARY KEY, path TEXT, sha256 TEXT, min_length INTEGER);
+            CREATE TABLE IF NOT EXISTS scans (
+                sha256 TEXT, min_length INTEGER, PRIMARY KEY (sha256, min_length));
+            CREATE TABLE IF NOT EXISTS strings (
+                sha256 TEXT, min_length INTEGER, offset INTEGER, region TEXT, string TEXT);
+            CREATE INDEX IF NOT EXISTS strings_scan ON strings (sha256, min_length);
+        ''')
+
+    def add_dump(self, dump='/tmp/k210.flash_dump', name=None, min_length=6, verbose=False):
+        '''
+        indexes dump as name, which defaults to its path, returning its sha256
+
+        a dump already added under name is replaced; its strings are only scanned when
+        no dump with the same contents was scanned before with the same min_length.
+        '''
+
+        from hashlib import sha256
+
+        name = name or dump
+        _hash = sha256()
+        with open(dump, 'rb') as f:
+            for some_bytes in iter(lambda: f.read(2**20), b''):
+                _hash.update(some_bytes)
+        digest = _hash.hexdigest()
+
+        scanned = self.db.execute('SELECT 1 FROM scans WHERE sha256 = ? AND min_length = ?',
+            (digest, min_length)).fetchone()
+        replaced = self.db.execute('SELECT sha256, min_length FROM dumps WHERE name = ?', (name,)).fetchone()
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO dumps VALUES (?, ?, ?, ?)',
+                (name, dump, digest, min_length))
+            if not scanned:
+                self.db.execute('INSERT INTO scans VALUES (?, ?)', (digest, min_length))
+                self.db.executemany('INSERT INTO strings VALUES (?, ?, ?, ?, ?)',
+                    ((digest, min_length, offset, flash_region(offset), string)
+                        for offset, string in strings_dump(dump, min_length)))
+            # forget the scan that name replaced, unless another dump still shares it
+            if replaced and not self.db.execute(
+                    'SELECT 1 FROM dumps WHERE sha256 = ? AND min_length = ?', replaced).fetchone():
+                self.db.execute('DELETE FROM scans WHERE sha256 = ? AND min_length = ?', replaced)
+                self.db.execute('DELETE FROM strings WHERE sha256 = ? AND min_length = ?', replaced)
+
+        if verbose:
+            print('%s %s as %s, sha256 %s: %s strings' % (
+                dump, 'shares an earlier scan' if scanned else 'indexed', name, digest,
+                self.db.execute('SELECT COUNT(*) FROM strings WHERE sha256 = ? AND min_length = ?',
+                    (digest, min_length)).fetchone()[0]))
+        return digest
+
+    def query(self, where, args=()):
+        return self.db.execute('''
+            SELECT dumps.name, strings.offset, strings.region, strings.string
+            FROM strings JOIN dumps
+                ON strings.sha256 = dumps.sha256 AND strings.min_length = dumps.min_length
+            WHERE %s ORDER BY dumps.name, strings.offset''' % where, args).fetchall()
+
+    def search(self, substring, region=None):
+        '''
+        returns tuple(dump name, offset, region, string) for strings containing substring
+        '''
+
+        if region:
+            return self.query('instr(strings.string, ?) AND strings.region = ?', (substring, region))
+        return self.query('instr(strings.string, ?)', (substring,))
+
+    def dumps_containing(self, substring, region=None):
+        '''
+        returns names of dumps that have a string containing substring
+        '''
+
+        return sorted(set([x[0] for x in self.search(substring, region)]))
+
+    def version_markers(self, pattern=VERSION_MARKER, regions=('firmware_slot1', 'firmware_slot2')):
+        '''
+        returns tuple(dump name, offset, region, string) for strings that look like versions
+        '''
+
+        return self.query('strings.region IN (%s) AND strings.string REGEXP ?' % (
+            ', '.join(['?'] * len(regions))), tuple(regions) + (pattern,))